@@ -1,27 +1,61 @@
 import sys
 from flask import (
     Flask,
+    Response,
     redirect,
     render_template,
     jsonify,
+    g,
     request,
     session,
 )
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import requests
-from requests.auth import HTTPBasicAuth
-from datetime import timedelta, datetime
+from requests.auth import AuthBase
+from datetime import timedelta, datetime, timezone
+from functools import lru_cache
+import base64
+import hashlib
+import logging
 import os
-import pytz
 import re
+import string
+import threading
+import time
 from dotenv import load_dotenv
 
+from http_session import HTTP_SESSION
 from trmnl import trmnl_bp
 
 INTERNAL_ERROR_MESSAGE = "An internal error has occurred."
 
 load_dotenv()
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serve jsonify() through orjson, which is much faster than the stdlib json
+    module. Keys are always sorted and non-string keys are stringified, matching
+    Flask's default output; an indent request (pretty-printed debug responses)
+    becomes orjson's 2-space indent. Other json.dumps options (ensure_ascii,
+    separators, the provider's sort_keys/ensure_ascii settings) are ignored.
+
+    Unlike Flask's provider, datetime/date values are serialized natively by
+    orjson as ISO 8601 strings, not HTTP dates; default() only sees types orjson
+    can't handle itself."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 app.secret_key = os.getenv("WHIB_FLASK_SECRET_KEY")
 app.permanent_session_lifetime = timedelta(days=30)
@@ -36,26 +70,114 @@ app.config.update(
     SESSION_COOKIE_SAMESITE="Lax",
 )
 
+# Optional server-side sessions. With WHIB_REDIS_URL set, session data lives in
+# Redis and the cookie only carries an opaque session ID, so the OwnTracks
+# credentials never travel to the browser and requests skip the cookie's
+# signature check and re-signing. Unset, the signed cookie above is used.
+REDIS_URL = os.getenv("WHIB_REDIS_URL")
+if REDIS_URL:
+    import redis
+    from flask_session import Session
+
+    app.config.update(
+        SESSION_TYPE="redis",
+        SESSION_REDIS=redis.Redis.from_url(REDIS_URL),
+    )
+    Session(app)
+
 DEFAULT_OSRM_URL = os.getenv("WHIB_DEFAULT_OSRM_URL")
 OWNTRACKS_URL = os.getenv("WHIB_OWNTRACKS_URL")
 
+# OwnTracks endpoints, built once. f-strings so a missing WHIB_OWNTRACKS_URL still
+# imports and is reported by the env check in __main__.
+OWNTRACKS_LAST_URL = f"{OWNTRACKS_URL}/api/0/last"
+OWNTRACKS_LOCATIONS_URL = f"{OWNTRACKS_URL}/api/0/locations"
+OWNTRACKS_AGGREGATE_ROADS_URL = f"{OWNTRACKS_URL}/api/aggregate-roads"
+OWNTRACKS_REGISTER_URL = f"{OWNTRACKS_URL}/api/register"
+OWNTRACKS_DELETE_ACCOUNT_URL = f"{OWNTRACKS_URL}/api/delete-account"
+
+# /register username rule, compiled once rather than looked up on every request.
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9-]{3,20}$')
+
+
+class _PrebuiltBasicAuth(AuthBase):
+    """Attach an already-encoded Basic Authorization header. Passed as auth=
+    rather than headers= so requests treats the call as explicitly
+    authenticated and never swaps in credentials from a .netrc entry for the
+    OwnTracks host."""
+
+    def __init__(self, header):
+        self.header = header
+
+    def __call__(self, r):
+        r.headers["Authorization"] = self.header
+        return r
+
+
+def _basic_auth(username, password):
+    """Basic auth for OwnTracks, encoded once up front instead of having
+    requests build an HTTPBasicAuth header per call. Latin-1 matches what
+    HTTPBasicAuth sends; credentials it can't encode fall back to UTF-8."""
+    credentials = f"{username}:{password}"
+    try:
+        raw = credentials.encode("latin1")
+    except UnicodeEncodeError:
+        raw = credentials.encode("utf-8")
+    return _PrebuiltBasicAuth("Basic " + base64.b64encode(raw).decode("ascii"))
+
+
+def _session_credentials():
+    """Return the logged-in username, reading the OwnTracks credentials out of
+    the session on first use in a request and keeping them on g. Only handlers
+    that need them call this, so static files and cached pages never touch the
+    session — reading it would make Flask add Vary: Cookie to their responses."""
+    if "username" not in g:
+        g.username = session.get("username")
+        g.password = session.get("password")
+    return g.username
+
+
+def _session_auth():
+    """Basic auth for the logged-in user's OwnTracks calls, built only by
+    handlers that make one (None when logged out, so callers must check the
+    session first)."""
+    if "auth" not in g:
+        username = _session_credentials()
+        g.auth = _basic_auth(username, g.password) if username else None
+    return g.auth
+
+
 # TRMNL e-ink display endpoints (/trmnl, /trmnl/preview) live in the trmnl package.
 app.register_blueprint(trmnl_bp)
 
 
+@lru_cache(maxsize=None)
+def _render_cached_page(template_name):
+    return render_template(template_name)
+
+
+def _render_static_page(template_name):
+    """Render a template that takes no per-request context. The HTML is the same
+    every time, so it's rendered once and reused; in debug mode it's re-rendered
+    so template edits still show up on reload."""
+    if app.debug:
+        return render_template(template_name)
+    return _render_cached_page(template_name)
+
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return _render_static_page("index.html")
 
 
 @app.route("/about")
 def guide():
-    return render_template("about.html")
+    return _render_static_page("about.html")
 
 
 @app.route("/how-to-use")
 def how_to_use():
-    return render_template("how-to-use.html")
+    return _render_static_page("how-to-use.html")
 
 @app.route("/setup")
 def setup_redirect():
@@ -73,6 +195,30 @@ def sign_out():
     return redirect("/")
 
 
+# Successful OwnTracks logins are remembered briefly so back-to-back logins skip
+# the upstream check. Keyed by a hash so no credentials are held in memory; only
+# successes are stored, so a typo never locks out the right password, and the
+# short TTL lets password changes take effect quickly.
+LOGIN_CACHE_TTL = 60
+LOGIN_CACHE_MAX_ENTRIES = 1024
+_validated_logins = {}  # sha256(username:password) -> expiry (time.monotonic)
+
+
+def _login_cache_key(username, password):
+    return hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
+
+
+def _remember_login(login_key):
+    now = time.monotonic()
+    if len(_validated_logins) >= LOGIN_CACHE_MAX_ENTRIES:
+        for key, expiry in list(_validated_logins.items()):
+            if expiry < now:
+                _validated_logins.pop(key, None)
+        if len(_validated_logins) >= LOGIN_CACHE_MAX_ENTRIES:
+            _validated_logins.clear()
+    _validated_logins[login_key] = now + LOGIN_CACHE_TTL
+
+
 """Create cookie with OwnTracks login info and URL
 
 """
@@ -84,23 +230,30 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
 
-        # Validate credentials against OwnTracks before storing in session
-        try:
-            # Scope to this user. The server enforces that /api/0/ reads carry
-            # a ?user= matching the authenticated account, so an unscoped call
-            # is rejected; a valid login still gets 200 for its own user.
-            validation = requests.get(
-                OWNTRACKS_URL + "/api/0/last",
-                auth=HTTPBasicAuth(username, password),
-                params={"user": username.lower()},
-                timeout=10,
-            )
-            if validation.status_code != 200:
-                app.logger.info(f"Login: OwnTracks returned {validation.status_code} for user '{username}'")
-                return render_template("index.html", login_error="Invalid username or password."), 401
-        except requests.RequestException as err:
-            app.logger.error(f"Login: Error validating with OwnTracks: {err}")
-            return render_template("index.html", login_error="Could not connect to server."), 500
+        # Validate credentials against OwnTracks before storing in session, unless
+        # this exact login was validated moments ago.
+        login_key = _login_cache_key(username, password)
+        if _validated_logins.get(login_key, 0) < time.monotonic():
+            try:
+                # Scope to this user. The server enforces that /api/0/ reads carry
+                # a ?user= matching the authenticated account, so an unscoped call
+                # is rejected; a valid login still gets 200 for its own user. Only
+                # the status matters, but the (small, user-scoped) body is read
+                # normally so the connection goes back to the pool for reuse.
+                validation = HTTP_SESSION.get(
+                    OWNTRACKS_LAST_URL,
+                    auth=_basic_auth(username, password),
+                    params={"user": username.lower()},
+                    timeout=10,
+                )
+                if validation.status_code != 200:
+                    app.logger.info(f"Login: OwnTracks returned {validation.status_code} for user '{username}'")
+                    return render_template("index.html", login_error="Invalid username or password."), 401
+            except requests.RequestException as err:
+                app.logger.error(f"Login: Error validating with OwnTracks: {err}")
+                return render_template("index.html", login_error="Could not connect to server."), 500
+
+            _remember_login(login_key)
 
         session.permanent = True
         session["username"] = username
@@ -116,20 +269,22 @@ def register():
         username = data.get("username", "").strip() if data else ""
         password = data.get("password", "") if data else ""
 
-        if not username or not re.match(r'^[a-zA-Z0-9-]{3,20}$', username):
+        if not username or not USERNAME_RE.match(username):
             return jsonify({"error": "Username must be 3-20 characters (letters, numbers, and hyphens)."}), 400
 
         if len(password) < 12:
             return jsonify({"error": "Password must be at least 12 characters."}), 400
-        if not re.search(r'[A-Z]', password):
+        # One pass over the password, then cheap set checks per character class.
+        password_chars = set(password)
+        if password_chars.isdisjoint(string.ascii_uppercase):
             return jsonify({"error": "Password must contain an uppercase letter."}), 400
-        if not re.search(r'[a-z]', password):
+        if password_chars.isdisjoint(string.ascii_lowercase):
             return jsonify({"error": "Password must contain a lowercase letter."}), 400
-        if not re.search(r'[0-9]', password):
+        if password_chars.isdisjoint(string.digits):
             return jsonify({"error": "Password must contain a number."}), 400
 
         payload = {"username": username, "password": password}
-        response = requests.post(OWNTRACKS_URL + "/api/register", json=payload, timeout=10)
+        response = HTTP_SESSION.post(OWNTRACKS_REGISTER_URL, json=payload, timeout=10)
 
         if response.status_code == 201:
             session.permanent = True
@@ -148,7 +303,7 @@ def register():
 
 @app.route("/delete-account", methods=["POST"])
 def delete_account():
-    username = session.get("username")
+    username = _session_credentials()
     if not username:
         return jsonify({"error": "Not logged in."}), 401
 
@@ -163,10 +318,12 @@ def delete_account():
             "username": username,
             "password": password,
         }
-        response = requests.post(OWNTRACKS_URL + "/api/delete-account", json=payload, timeout=10)
+        response = HTTP_SESSION.post(OWNTRACKS_DELETE_ACCOUNT_URL, json=payload, timeout=10)
 
         if response.status_code == 200:
             session.clear()
+            # Forget the cached login so the deleted credentials stop passing /login.
+            _validated_logins.pop(_login_cache_key(username, password), None)
 
         return jsonify(response.json()), response.status_code
 
@@ -198,6 +355,21 @@ def get_settings():
     })
 
 
+def _stream_upstream(response, label, chunk_size=64 * 1024):
+    """Relay a streamed upstream body chunk by chunk, releasing the connection
+    back to the pool once the client has it all (or goes away).
+
+    The 200 headers are already sent by the time this runs, so an upstream
+    failure mid-body can't become a JSON error any more; log it (the handler's
+    except blocks no longer see it) and end the response."""
+    try:
+        yield from response.iter_content(chunk_size=chunk_size)
+    except requests.RequestException as err:
+        app.logger.error(f"{label}: Upstream failed while streaming the response: {err}")
+    finally:
+        response.close()
+
+
 """Get OwnTracks data from server and return to client
 
 
@@ -206,6 +378,12 @@ def get_settings():
 
 @app.route("/locations")
 def get_locations():
+    # Check the session before going upstream: without credentials requests
+    # would fall back to any .netrc entry for the OwnTracks host.
+    username = _session_credentials()
+    if not username:
+        return jsonify({"error": "Not logged in."}), 401
+
     try:
         params = {
             "from": "2015-01-01T01:00:00.0002Z",
@@ -221,29 +399,33 @@ def get_locations():
         # Convert from local time to UTC
         if start_date:
             local_dt = datetime.fromisoformat(start_date)  # interpreted as local time
-            utc_dt = local_dt.astimezone(pytz.UTC)  # convert to UTC
+            utc_dt = local_dt.astimezone(timezone.utc)  # convert to UTC
             params["from"] = utc_dt.isoformat(timespec='milliseconds').replace("+00:00", "Z")
 
         if end_date:
             local_dt = datetime.fromisoformat(end_date)
-            utc_dt = local_dt.astimezone(pytz.UTC)
+            utc_dt = local_dt.astimezone(timezone.utc)
             params["to"] = utc_dt.isoformat(timespec='milliseconds').replace("+00:00", "Z")
 
-        params["user"] = session.get("username", "").lower()
+        params["user"] = username.lower()
 
         if device:
             params["device"] = device
 
         # go make the request with login info from cookie
-        response = requests.get(
-            OWNTRACKS_URL + "/api/0/locations",
-            auth=HTTPBasicAuth(session.get("username"), session.get("password")),
+        response = HTTP_SESSION.get(
+            OWNTRACKS_LOCATIONS_URL,
+            auth=_session_auth(),
             params=params,
+            timeout=60,
+            stream=True,
         )
+        if not response.ok:
+            response.close()
         response.raise_for_status()
-        data = response.json()
-        # print(data)  # Print data to console
-        return jsonify(data)
+        # Stream the GeoJSON straight through as it arrives rather than buffering
+        # (and decoding/re-encoding) a possibly multi-MB body before replying.
+        return Response(_stream_upstream(response, "Locations"), mimetype="application/json")
     except requests.HTTPError:
         return jsonify({"error": INTERNAL_ERROR_MESSAGE}), 500
     except Exception as err:
@@ -259,9 +441,9 @@ def everyone():
     from the main map: there are NO date/device filters here, because a date
     window could reveal where someone currently is. Requires login.
     """
-    if not session.get("username"):
+    if not _session_credentials():
         return redirect("/")
-    return render_template("everyone.html")
+    return _render_static_page("everyone.html")
 
 
 @app.route("/all-roads")
@@ -272,23 +454,21 @@ def get_all_roads():
     only capability this exposes is fetching the single anonymized merged shape,
     so it cannot be used to read an individual user's data.
     """
-    username = session.get("username")
-    password = session.get("password")
-    if not username:
+    if not _session_credentials():
         return jsonify({"error": "Not logged in."}), 401
 
     try:
         # Cold computation can be slow; the backend caches and returns 503 while
         # it warms, which we surface so the client can retry.
-        response = requests.get(
-            OWNTRACKS_URL + "/api/aggregate-roads",
-            auth=HTTPBasicAuth(username, password),
+        response = HTTP_SESSION.get(
+            OWNTRACKS_AGGREGATE_ROADS_URL,
+            auth=_session_auth(),
             timeout=120,
         )
         if response.status_code == 503:
             return jsonify({"error": "warming"}), 503
         response.raise_for_status()
-        return jsonify(response.json())
+        return Response(response.content, mimetype="application/json")
     except requests.Timeout:
         return jsonify({"error": "Aggregate computation timed out, try again."}), 504
     except requests.HTTPError:
@@ -300,25 +480,34 @@ def get_all_roads():
 
 @app.route("/usersdevices")
 def get_users_devices():
-    try:
+    # The frontend treats any failure here as "not logged in", so answer that
+    # directly instead of sending an anonymous request upstream.
+    username = _session_credentials()
+    if not username:
+        return jsonify({"error": "Not logged in."}), 401
 
+    try:
         # Scope the recorder query to the logged-in user. Unscoped, /api/0/last
         # returns every user's last position (and the server rejects it under
         # per-user isolation); the client-side filter below stays as defence in
         # depth.
-        username = session.get("username")
-        response = requests.get(
-            OWNTRACKS_URL + "/api/0/last",
-            auth=HTTPBasicAuth(session.get("username"), session.get("password")),
-            params={"user": username.lower()} if username else None,
+        username_lower = username.lower()
+        response = HTTP_SESSION.get(
+            OWNTRACKS_LAST_URL,
+            auth=_session_auth(),
+            params={"user": username_lower},
+            timeout=10,
         )
         response.raise_for_status()
         data = response.json()
         # Filter to only the logged-in user's data
-        app.logger.info(f"UsersDevices: OwnTracks returned {len(data)} entries, filtering for user '{username}'")
-        app.logger.debug(f"UsersDevices: Usernames in response: {[e.get('username') for e in data]}")
-        filtered = [entry for entry in data if entry.get("username", "").lower() == username.lower()]
-        app.logger.info(f"UsersDevices: {len(filtered)} entries after filtering")
+        # Lazy %-formatting (and the isEnabledFor guard around the list) keeps this
+        # per-request logging free when the level is filtered out.
+        app.logger.info("UsersDevices: OwnTracks returned %d entries, filtering for user '%s'", len(data), username)
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("UsersDevices: Usernames in response: %s", [e.get('username') for e in data])
+        filtered = [entry for entry in data if entry.get("username", "").lower() == username_lower]
+        app.logger.info("UsersDevices: %d entries after filtering", len(filtered))
         return jsonify(filtered)
     except requests.HTTPError as http_err:
         app.logger.error(f"UsersAndDevices: HTTP error occurred: {http_err}")
@@ -328,6 +517,54 @@ def get_users_devices():
         return jsonify({"error": INTERNAL_ERROR_MESSAGE}), 500
 
 
+# Query suffix the client appends to route requests; dropped before forwarding.
+OSRM_OVERVIEW_SUFFIX = "?overview=false"
+
+
+# Successful OSRM responses are cached briefly: routes are deterministic for a
+# given URL, but the OSRM data gets rebuilt, so entries expire after a day. The
+# cache is bounded by total body size rather than entry count, because the client
+# controls the query (e.g. overview=full) and a few geometries can be large.
+OSRM_CACHE_TTL = 24 * 60 * 60
+OSRM_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_osrm_cache = {}  # target_url -> (expiry (time.monotonic), body); oldest first
+_osrm_cache_bytes = 0
+_osrm_cache_lock = threading.Lock()
+
+
+def _remember_osrm_route(target_url, body):
+    global _osrm_cache_bytes
+    if len(body) > OSRM_CACHE_MAX_BYTES:
+        return
+    now = time.monotonic()
+    with _osrm_cache_lock:
+        old = _osrm_cache.pop(target_url, None)
+        if old:
+            _osrm_cache_bytes -= len(old[1])
+        # Every entry has the same TTL, so insertion order is expiry order: drop
+        # from the front until nothing expired is left and the new body fits.
+        while _osrm_cache:
+            oldest_url, (expiry, oldest_body) = next(iter(_osrm_cache.items()))
+            if expiry > now and _osrm_cache_bytes + len(body) <= OSRM_CACHE_MAX_BYTES:
+                break
+            del _osrm_cache[oldest_url]
+            _osrm_cache_bytes -= len(oldest_body)
+        _osrm_cache[target_url] = (now + OSRM_CACHE_TTL, body)
+        _osrm_cache_bytes += len(body)
+
+
+def _fetch_osrm_route(target_url):
+    """Fetch one OSRM route response body, from the cache while it's fresh.
+    Raises on failure so failures aren't cached."""
+    cached = _osrm_cache.get(target_url)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    response = HTTP_SESSION.get(target_url, timeout=30)
+    response.raise_for_status()
+    _remember_osrm_route(target_url, response.content)
+    return response.content
+
+
 """Proxy routing requests to our OSRM server.
 
 The OSRM server only speaks HTTP, so the browser can't call it directly from an
@@ -343,7 +580,7 @@ external URLs). Custom OSRM routers are no longer supported.
 @app.route("/proxy", methods=["GET"])
 def proxy_route():
     # Require a valid session so this isn't an open, unauthenticated proxy.
-    if not session.get("username"):
+    if not _session_credentials():
         return jsonify({"error": "Not logged in."}), 401
 
     coords = request.args.get("coords")
@@ -351,15 +588,15 @@ def proxy_route():
         return jsonify({"error": "Missing coords parameter."}), 400
     # The client prefixes coords with a leading separator char; strip it.
     coords = coords[1:]
+    if coords.endswith(OSRM_OVERVIEW_SUFFIX):
+        coords = coords[:-len(OSRM_OVERVIEW_SUFFIX)]
+    if not coords:
+        return jsonify({"error": "Missing coords parameter."}), 400
 
     target_url = f"{DEFAULT_OSRM_URL}/route/v1/{coords}"
-    if target_url.endswith("?overview=false"):
-        target_url = target_url.replace("?overview=false", "")
 
     try:
-        response = requests.get(target_url, timeout=30)
-        response.raise_for_status()
-        return jsonify(response.json())
+        return Response(_fetch_osrm_route(target_url), mimetype="application/json")
     except requests.RequestException as err:
         app.logger.error(f"Proxy: Error contacting OSRM server: {err}")
         return jsonify({"error": INTERNAL_ERROR_MESSAGE}), 502
@@ -378,4 +615,14 @@ if __name__ == "__main__":
     from waitress import serve
 
     print("Server running on http://127.0.0.1:5000")
-    serve(app, host="0.0.0.0", port=5000, threads=10)
+    # Every handler spends its time waiting on OwnTracks/OSRM with the GIL
+    # released, so run plenty of threads (matched by the upstream pool size in
+    # http_session.py) and cap open connections explicitly.
+    serve(
+        app,
+        host="0.0.0.0",
+        port=5000,
+        threads=64,
+        connection_limit=1000,
+        channel_timeout=30,
+    )
@@ -0,0 +1,43 @@
+"""Shared HTTP session for upstream calls.
+
+Both the main app and the TRMNL blueprint talk to the same OwnTracks server, so
+they share one connection pool rather than each opening fresh connections. The
+timeout each caller passes (e.g. TRMNL's 60s per-device /api/0/locations fetch
+or 15s OSM tile fetch) bounds the whole wait, since read timeouts aren't retried.
+"""
+
+import http.cookiejar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep-alive sockets are reused across requests instead of paying a fresh TCP+TLS
+# handshake each time. The pool is sized to Waitress's thread count (app.py) so
+# no worker waits on a connection. Retries only cover connection failures and 502
+# gateway errors on idempotent requests. Read timeouts are never retried
+# (read=False), so each caller's timeout bounds the whole wait and still surfaces
+# as requests.Timeout. 504 is left out for the same reason: it means a gateway
+# already waited out its own timeout, and retrying would resend slow work such as
+# the cold /api/aggregate-roads computation. 503 is left out because that
+# endpoint uses it to mean "still warming", which the client retries itself.
+# raise_on_status=False hands the last response back instead of raising, so
+# callers keep seeing the upstream status.
+HTTP_SESSION = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=2,
+        read=False,
+        backoff_factor=0.1,
+        status_forcelist=[502],
+        raise_on_status=False,
+    ),
+)
+HTTP_SESSION.mount("http://", _http_adapter)
+HTTP_SESSION.mount("https://", _http_adapter)
+# The session is shared by every user, so it must never keep cookies: a
+# Set-Cookie from OwnTracks (or a proxy/load balancer in front of it) would
+# otherwise be replayed on later requests made on behalf of other users.
+HTTP_SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
@@ -71,8 +71,16 @@ async function fetchLocations(options = {}) {
             throw new Error('Error fetching location data. Are you logged in?');
         }
 
-        // Parse the response JSON
-        const data = await response.json();
+        // Parse the response JSON. /locations streams the body through from
+        // OwnTracks, so an upstream failure mid-transfer arrives as a 200 with a
+        // truncated body; treat a body that won't parse as a failed fetch.
+        let data;
+        try {
+            data = await response.json();
+        } catch (parseError) {
+            setProgressBarError();  // Update progress bar with error state
+            throw new Error('Location data was cut off in transfer. Please try again.');
+        }
 
         // Handle empty data
         if (!data.features || data.features.length === 0) {
@@ -32,6 +32,8 @@ from flask import (
 )
 from requests.auth import HTTPBasicAuth
 
+from http_session import HTTP_SESSION
+
 load_dotenv()
 
 OWNTRACKS_URL = os.getenv("WHIB_OWNTRACKS_URL")
@@ -66,7 +68,7 @@ def _fetch_osm_tile(z, x, y):
     """Fetch one OSM tile with the headers OSM requires. Cached in memory; raises
     on failure so failures aren't cached. Only reached with validated coords."""
     sub = "abc"[(x + y) % 3]
-    response = requests.get(
+    response = HTTP_SESSION.get(
         f"https://{sub}.tile.openstreetmap.org/{z}/{x}/{y}.png",
         headers={"User-Agent": OSM_TILE_UA, "Referer": OSM_TILE_REFERER},
         timeout=15,
@@ -268,7 +270,7 @@ def _trmnl_iso(dt):
 
 def _trmnl_last_entries(username, password):
     """The user's last-known position per device, via /api/0/last."""
-    response = requests.get(
+    response = HTTP_SESSION.get(
         OWNTRACKS_URL + "/api/0/last",
         auth=HTTPBasicAuth(username, password),
         params={"user": username.lower()},
@@ -306,7 +308,7 @@ def _trmnl_fetch_features(username, password, start, end, devices):
             "user": username.lower(),
             "device": device,
         }
-        response = requests.get(
+        response = HTTP_SESSION.get(
             OWNTRACKS_URL + "/api/0/locations",
             auth=HTTPBasicAuth(username, password),
             params=params,
@@ -458,7 +460,7 @@ def _trmnl_debug(username, password):
 
     def probe(label, params):
         try:
-            r = requests.get(
+            r = HTTP_SESSION.get(
                 OWNTRACKS_URL + "/api/0/locations",
                 auth=HTTPBasicAuth(username, password),
                 params=params,
@@ -476,8 +478,8 @@ def _trmnl_debug(username, password):
     # Discover the device name from /api/0/last so we can probe user+device too.
     device = None
     try:
-        r = requests.get(OWNTRACKS_URL + "/api/0/last", auth=HTTPBasicAuth(username, password),
-                         params={"user": username.lower()}, timeout=30)
+        r = HTTP_SESSION.get(OWNTRACKS_URL + "/api/0/last", auth=HTTPBasicAuth(username, password),
+                             params={"user": username.lower()}, timeout=30)
         entries = r.json() if r.status_code == 200 else []
         if entries and isinstance(entries[0], dict):
             device = entries[0].get("device")